@@ -0,0 +1,77 @@
+"""
+Microphone audio shared by wake word detection and transcription.
+
+The PyAudio input stream runs in callback mode: PortAudio's own audio thread hands
+each captured buffer to `AudioHub.callback`, which splits it into fixed-size chunks
+and queues them. Audio is therefore never dropped while the main loop is busy
+(speaking, dispatching commands, etc.), and no Python thread has to sit in a
+blocking read. Chunks are handed out through a `read()` method with the same
+signature as `pyaudio.Stream.read`, so consumers can use either object.
+"""
+
+import collections
+import threading
+
+import pyaudio
+
+# How much captured-but-unread audio to keep, in seconds. Older chunks are
+# discarded if the consumer falls further behind than this.
+BACKLOG_SECONDS = 2.0
+
+SAMPLE_WIDTH = 2  # Bytes per sample (16-bit mono PCM)
+
+
+class AudioHub:
+    """Queues fixed-size chunks delivered by a PyAudio stream callback."""
+
+    def __init__(self, rate: int, chunk: int):
+        """
+        Args:
+            rate: Sample rate of the stream in Hz.
+            chunk: Number of frames per chunk handed to consumers; the stream's
+                   frames_per_buffer must be a multiple of it.
+        """
+        self.chunk = chunk
+        self._chunk_bytes = chunk * SAMPLE_WIDTH
+        self._pending = collections.deque(maxlen=max(1, int(BACKLOG_SECONDS * rate / chunk)))
+        self._cond = threading.Condition()
+        self._running = True
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio stream callback: queue the captured buffer in chunk-sized pieces."""
+        step = self._chunk_bytes
+        with self._cond:
+            if len(in_data) == step:
+                self._pending.append(in_data)
+            else:
+                for i in range(0, len(in_data), step):
+                    self._pending.append(in_data[i:i + step])
+            self._cond.notify()
+        return (None, pyaudio.paContinue)
+
+    def read(self, num_frames: int, exception_on_overflow: bool = False) -> bytes:
+        """
+        Return the next captured chunk, blocking until one is available.
+
+        Args:
+            num_frames: Must equal the hub's chunk size.
+            exception_on_overflow: Accepted for compatibility with `pyaudio.Stream.read`;
+                                   overflow is handled by the bounded backlog instead.
+
+        Returns:
+            bytes: Raw 16-bit PCM audio, or b"" once the hub has been closed.
+        """
+        if num_frames != self.chunk:
+            raise ValueError(f"AudioHub delivers {self.chunk}-frame chunks, not {num_frames}")
+        with self._cond:
+            while not self._pending:
+                if not self._running:
+                    return b""
+                self._cond.wait()
+            return self._pending.popleft()
+
+    def close(self):
+        """Wake any blocked reader; subsequent reads return b"" once the backlog is empty."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
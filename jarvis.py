@@ -2,64 +2,94 @@
 Main Jarvis voice assistant orchestrator.
 """
 
+import collections
+import json
 import logging
 import os
-import queue
+import random
+import re
+import signal
+import sys
 import threading
 import time
-import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import MappingProxyType
 
-import comtypes.client
 import pyaudio
-import pyttsx3
-import pyttsx3.drivers.sapi5 as sapi5
-import pythoncom
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-from transcribe import record_and_transcribe
+from audio_hub import AudioHub
+from transcribe import initialize_vosk_model, record_and_transcribe, set_rms_threshold
 from wake_word import wait_for_wake_word
 
 # Load configuration
 load_dotenv()
 
-# --- Monkey-patch sapi5 driver to skip broken default voice assignment ---
-def patched_sapi5_init(self, proxy):
-    self._tts = comtypes.client.CreateObject('SAPI.SpVoice')
-    self._tts.EventInterests = 33790
-    self._event_sink = sapi5.SAPI5DriverEventSink()
-    self._event_sink.setDriver(weakref.proxy(self))
-    self._advise = comtypes.client.GetEvents(self._tts, self._event_sink)
-    self._proxy = proxy
-    self._looping = False
-    self._speaking = False
-    self._stopping = False
-    self._current_text = ''
-    self._rateWpm = 200
-
-sapi5.SAPI5Driver.__init__ = patched_sapi5_init
+# Per-command status messages go through this logger; they are only shown when
+# JARVIS_VERBOSE=1, so a quiet deployment pays no formatting or I/O cost for them.
+logger = logging.getLogger("jarvis")
+VERBOSE = os.getenv("JARVIS_VERBOSE") == "1"
+# JARVIS_TTS=0 turns spoken responses off; the SAPI engine is then never initialized
+TTS_ENABLED = os.getenv("JARVIS_TTS", "1") != "0"
+# JARVIS_RMS_THRESHOLD overrides the transcription silence threshold (RMS amplitude),
+# e.g. for a noisy room or a quiet microphone; unset keeps transcribe.py's default
+RMS_THRESHOLD = int(os.getenv("JARVIS_RMS_THRESHOLD", "0")) or None
 
 # ─── async, interruptible text-to-speech ────────────────────────────────
 
+# SpeechVoiceSpeakFlags
+SVSF_ASYNC = 1            # Return immediately; SAPI queues and plays the phrase itself
+SVSF_PURGE = 2            # Discard everything queued or playing before this call
+
 class AsyncTTS:
     """Asynchronous TTS using raw COM SAPI with guaranteed voice control."""
-    def __init__(self):
-        self._q = queue.Queue()
+    def __init__(self, start: bool = True):
+        """
+        Args:
+            start: Create the SAPI engine. When False no worker thread or COM engine
+                   is created at all and every phrase is silently dropped.
+        """
+        # Single producer / single consumer: deque append/popleft are atomic, so an
+        # Event is all the worker needs to sleep on instead of a Queue's Condition.
+        self._q = collections.deque()
+        self._wake = threading.Event()
+        self._ready = threading.Event()   # Set once the worker has finished engine setup
+        # Whether phrases are accepted; cleared if the engine fails to start or on shutdown.
+        # An Event gives properly synchronized reads across the caller and worker threads.
+        self.enabled = threading.Event()
+        self._interrupt = threading.Event()  # Asks the worker to purge SAPI's queue
+        # Asks the worker to exit. A flag rather than an in-band queue sentinel, so
+        # stop() clearing the queue can never swallow a shutdown request.
+        self._closed = threading.Event()
+        if not start:
+            return
         self._thread = threading.Thread(target=self._worker, daemon=True)
         self._thread.start()
+        # COM objects must be driven from the thread that created them, so the engine
+        # is built on the worker; block here until it is warm so the first "Yes?" after
+        # the wake word doesn't pay the SAPI start-up cost.
+        self._ready.wait()
 
     def _worker(self):
+        # COM is only ever touched from this thread, so its modules are imported here
+        # rather than at start-up of the main thread.
+        import comtypes.client
+        import pythoncom
+
         pythoncom.CoInitialize()
 
         try:
             self.engine = comtypes.client.CreateObject("SAPI.SpVoice")
             voices = self.engine.GetVoices()
-            print("\nAvailable voices from COM:")
+            logger.info("Available voices from COM:")
 
             selected = None
             for v in voices:
                 desc = v.GetDescription()
-                print(f"- {desc} | {v.Id}")
+                logger.info("- %s | %s", desc, v.Id)
                 if "DAVID" in desc.upper():
                     selected = v
                     break
@@ -72,243 +102,616 @@ class AsyncTTS:
                 raise RuntimeError("No preferred voice found.")
 
             self.engine.Voice = selected
-            print(f"Using raw COM voice: {selected.GetDescription()}")
+            logger.info("Using raw COM voice: %s", selected.GetDescription())
+            self.engine.Speak("")  # Prime the audio output path before the first real phrase
 
         except Exception as e:
-            print("COM TTS init failed:", e)
+            logger.error("COM TTS init failed: %s", e)
+            self._ready.set()  # enabled stays clear, so phrases are dropped rather than queued
             return
 
-        for text in iter(self._q.get, None):
-            try:
-                self.engine.Speak(text)
-            except Exception as e:
-                print("COM TTS speak failed:", e)
+        self.enabled.set()
+        self._ready.set()
+
+        # Bind hot-loop attributes to locals once
+        q = self._q
+        popleft = q.popleft
+        wake = self._wake
+        interrupt = self._interrupt
+        closed = self._closed
+        speak = self.engine.Speak
+        while True:
+            wake.wait()
+            wake.clear()  # Clear before draining so a concurrent append re-wakes us
+            while True:
+                if closed.is_set():
+                    return
+                # Interruptions are applied here, on the thread that owns the COM object,
+                # and before any phrase queued after the interruption.
+                if interrupt.is_set():
+                    interrupt.clear()
+                    try:
+                        speak("", SVSF_ASYNC | SVSF_PURGE)
+                    except Exception as e:
+                        logger.warning("COM TTS stop failed: %s", e)
+                if not q:
+                    break
+                text = popleft()
+                try:
+                    # Async speak hands the phrase to SAPI's own queue, so the next one is
+                    # synthesized and played back-to-back while this thread stays free.
+                    speak(text, SVSF_ASYNC)
+                except Exception as e:
+                    logger.warning("COM TTS speak failed: %s", e)
 
     def speak_async(self, text: str):
-        self._q.put(text)
+        if self.enabled.is_set():
+            self._q.append(text)
+            self._wake.set()
 
     def stop(self):
-        try:
-            if hasattr(self, "engine"):
-                self.engine.Speak("", 3)  # SVSFPurgeBeforeSpeak = 3
-        except Exception as e:
-            print("COM TTS stop failed:", e)
+        """Drop any queued phrases and cut off the one currently being spoken."""
+        if not self.enabled.is_set():  # Engine never started (or already shut down)
+            return
+        self._q.clear()  # Pending phrases are stale once the user interrupts
+        self._interrupt.set()
+        self._wake.set()
 
     def shutdown(self):
-        self._q.put(None)
-
-tts = AsyncTTS()                            # Async text-to-speech engine
-
-# HTTP session for reusing connections (improves performance by pooling connections)
-session = requests.Session()
+        self.enabled.clear()
+        self._closed.set()
+        self._wake.set()
+
+@dataclass(frozen=True, slots=True)
+class JarvisConfig:
+    """Music bot settings read once from the environment and never mutated."""
+    guild_id: str | None                     # Discord server ID
+    user_id: str | None                      # User's Discord ID
+    voice_channel_id: str | None             # Target voice channel
+    music_bot_url: str | None                # Base URL of the music bot API, ending in "/"
+
+    @classmethod
+    def from_env(cls) -> "JarvisConfig":
+        """Build the config from environment variables (after load_dotenv())."""
+        music_bot_url = os.getenv("MUSIC_BOT_URL") or None
+        # Command names are appended directly to the base URL, so make sure it ends in "/"
+        if music_bot_url and not music_bot_url.endswith("/"):
+            music_bot_url += "/"
+        return cls(
+            guild_id=os.getenv("GUILD_ID"),
+            user_id=os.getenv("USER_ID"),
+            voice_channel_id=os.getenv("VOICE_CHANNEL_ID"),
+            music_bot_url=music_bot_url,
+        )
 
 # Music bot configuration from environment
-guild_id = os.getenv("GUILD_ID")             # Discord server ID
-user_id = os.getenv("USER_ID")               # User's Discord ID
-voice_channel_id = os.getenv("VOICE_CHANNEL_ID")  # Target voice channel
-music_bot_base_url = os.getenv("MUSIC_BOT_URL")
-
-# Add a check for music_bot_base_url
-if music_bot_base_url is None:
+CFG = JarvisConfig.from_env()
+
+# Identity fields shared by every music bot request; built once (read-only) instead of per call
+BASE_PAYLOAD = MappingProxyType({
+    "guildId": CFG.guild_id,                # Discord Server ID where the bot operates
+    "userId": CFG.user_id,                  # Discord User ID of the person issuing the command
+    "voiceChannelId": CFG.voice_channel_id,  # Discord Voice Channel ID to join/play in
+})
+
+# Endpoint URLs for the fixed set of music bot commands, resolved once at import
+MUSIC_BOT_COMMANDS = ("play", "stop", "pause", "resume", "next", "clear", "now-playing")
+CMD_URLS = {c: f"{CFG.music_bot_url}{c}" for c in MUSIC_BOT_COMMANDS} if CFG.music_bot_url else {}
+
+# Number of music bot requests that may be in flight at once. Each worker gets its own
+# pooled keep-alive connection, so a slow response never holds up the next command.
+MUSIC_BOT_WORKERS = 2
+
+# HTTP session for reusing connections (improves performance by pooling connections).
+# All traffic goes to a single host, so one small keep-alive pool is enough. urllib3's
+# own retries are disabled: _post() already retries (with backoff and the circuit
+# breaker), and stacking both would multiply attempts against a struggling bot.
+session = requests.Session()
+session.headers["Connection"] = "keep-alive"
+session.headers["Content-Type"] = "application/json"
+if CFG.music_bot_url:
+    session.mount(CFG.music_bot_url, HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=MUSIC_BOT_WORKERS,
+        max_retries=0,
+    ))
+_session_post = session.post                 # Bound once; every music bot request is a POST
+
+# Add a check for the music bot URL
+if CFG.music_bot_url is None:
     print("\nERROR: The MUSIC_BOT_URL environment variable is not set.")
     print("Please ensure it is defined in your .env file (e.g., MUSIC_BOT_URL=http://localhost:3000/api/).")
     print("Music bot commands will not function.\n")
     # Optionally, you could raise an exception here or set a flag to disable music commands
     # For now, it will print the error and continue, but API calls will fail.
 
-# Configure and initialize shared audio input stream
+# Shared audio input stream configuration
 RATE = 16_000                                # Audio sample rate in Hz (samples per second)
-CHUNK = 512                                  # Number of audio frames per buffer (chunk size)
-_pa = pyaudio.PyAudio()                      # Private PyAudio instance for managing audio resources
-shared_stream = _pa.open(format=pyaudio.paInt16,  # 16-bit PCM audio format
-                        channels=1,                 # Mono audio
-                        rate=RATE,                  # Sample rate
-                        input=True,                 # Specifies that this is an input stream
-                        frames_per_buffer=CHUNK)    # Number of frames per buffer
-# This shared_stream is used by both wake word detection and transcription modules.
-
-def send_play_command(song_name: str, max_retries: int = 3, retry_delay: float = 1.0, immediate: bool = False):
+CHUNK = 512                                  # Number of audio frames per read (chunk size)
+# PortAudio's host buffer holds two reads' worth of audio, halving the number of
+# callbacks (one per ~64 ms at 16 kHz); AudioHub splits each buffer back into CHUNK
+# frames, which is what Porcupine requires per frame.
+STREAM_BUFFER_FRAMES = 2 * CHUNK
+
+@dataclass
+class Services:
+    """Long-lived resources created at startup and released on shutdown."""
+    tts: AsyncTTS                            # Async text-to-speech engine
+    pa: pyaudio.PyAudio                      # PyAudio instance for managing audio resources
+    shared_stream: pyaudio.PyAudio.Stream    # Raw microphone stream
+    audio: AudioHub                          # Captured chunks read by wake word and transcription
+
+    def close(self):
+        """
+        Stop the audio stream, release PyAudio and shut down the TTS worker.
+
+        Each step runs even if an earlier one fails, so PyAudio is always terminated
+        and the microphone device released.
+        """
+        steps = (
+            self._stop_stream,               # Stop the stream (and its callback) before closing
+            self.audio.close,                # Wake any reader still waiting for audio
+            self.shared_stream.close,        # Release the audio stream resource
+            self.pa.terminate,               # Terminate the PyAudio session
+            self.tts.shutdown,               # Gracefully shut down the TTS worker thread
+        )
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                logger.warning("Cleanup step %s failed: %s", step.__qualname__, e)
+
+    def _stop_stream(self):
+        """Stop the microphone stream if it is still running."""
+        if self.shared_stream.is_active():
+            self.shared_stream.stop_stream()
+
+def init_services() -> Services:
+    """
+    Create the TTS worker, load the speech model and open the shared microphone stream.
+
+    Kept out of module import so that importing jarvis has no side effects on
+    audio devices or background threads.
+
+    Returns:
+        Services: The initialized resources.
+    """
+    tts = AsyncTTS(start=TTS_ENABLED)
+    pa = None
+    try:
+        initialize_vosk_model()  # Load before opening the mic so no audio backs up during the load
+        if RMS_THRESHOLD is not None:
+            set_rms_threshold(RMS_THRESHOLD)
+        pa = pyaudio.PyAudio()
+        # PortAudio delivers each captured buffer to the hub's callback on its own audio
+        # thread; wake word detection and transcription both read from the hub, so no
+        # audio is lost while commands run.
+        audio = AudioHub(RATE, CHUNK)
+        shared_stream = pa.open(format=pyaudio.paInt16,  # 16-bit PCM audio format
+                                channels=1,                 # Mono audio
+                                rate=RATE,                  # Sample rate
+                                input=True,                 # Specifies that this is an input stream
+                                frames_per_buffer=STREAM_BUFFER_FRAMES,  # Host buffer size in frames
+                                stream_callback=audio.callback)          # Non-blocking capture
+    except BaseException:
+        # main() never receives a Services to close, so release what was created here
+        # (including on Ctrl-C during the model load) before propagating.
+        if pa is not None:
+            pa.terminate()
+        tts.shutdown()
+        raise
+    return Services(tts=tts, pa=pa, shared_stream=shared_stream, audio=audio)
+
+# Timeouts (connect, read) in seconds so a hung music bot can't stall a request forever
+REQUEST_TIMEOUT = (1.0, 3.0)
+
+# Upper bound (seconds) on a single backoff sleep between retries
+MAX_RETRY_DELAY = 4.0
+
+# Circuit breaker: after BREAKER_THRESHOLD consecutive failed requests, stop contacting
+# the music bot for BREAKER_COOLDOWN seconds and fail fast instead.
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 30.0
+_breaker_lock = threading.Lock()
+_fail_count = 0
+_breaker_until = 0.0
+
+def music_bot_available() -> bool:
+    """Return False while the circuit breaker is open after repeated failures."""
+    return time.monotonic() >= _breaker_until
+
+def _record_result(ok: bool):
+    """Update the circuit breaker with the outcome of one request (after its retries)."""
+    global _fail_count, _breaker_until
+    with _breaker_lock:
+        if ok:
+            _fail_count = 0
+            return
+        _fail_count += 1
+        if _fail_count >= BREAKER_THRESHOLD:
+            _fail_count = 0
+            _breaker_until = time.monotonic() + BREAKER_COOLDOWN
+            logger.warning("Music bot unreachable; pausing requests for %.0fs.", BREAKER_COOLDOWN)
+
+def _encode_payload(payload) -> bytes:
+    """Serialize a request payload to compact JSON bytes (the session already sets Content-Type)."""
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+# Control commands carry no options, so their body is identical every time: encode it once
+COMMAND_BODY = _encode_payload({**BASE_PAYLOAD, "options": {}})
+
+def _is_connection_refused(exc: BaseException) -> bool:
+    """Return True if a ConnectionRefusedError is anywhere in the exception's chain."""
+    # requests wraps urllib3's MaxRetryError, whose `reason` wraps the socket error
+    stack = [exc]
+    seen = set()
+    while stack:
+        e = stack.pop()
+        if not isinstance(e, BaseException) or id(e) in seen:
+            continue
+        if isinstance(e, ConnectionRefusedError):
+            return True
+        seen.add(id(e))
+        stack.extend((e.__cause__, e.__context__, getattr(e, "reason", None), *e.args))
+    return False
+
+def _post(url: str, body: bytes, description: str, max_retries: int, retry_delay: float):
+    """
+    POST a JSON body to the music bot with timeouts, retries and the circuit breaker.
+
+    Args:
+        url: Full endpoint URL
+        body: Pre-serialized JSON body, encoded once and reused across retries
+        description: Human-readable action used in log messages (e.g., "play 'x'")
+        max_retries: Maximum number of retries on failure
+        retry_delay: Base delay (in seconds) before the first retry; doubles on each
+                     further attempt up to MAX_RETRY_DELAY, plus a little random jitter
+
+    Returns:
+        dict: Response from the music bot API, or None on failure or a reply without a JSON body
+    """
+    if not music_bot_available():
+        logger.warning("Music bot unavailable; not attempting to %s.", description)
+        return None
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            response = _session_post(url, data=body, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code < 500:
+                # A 4xx means the bot is up but rejected the request; retrying won't help
+                logger.warning("Music bot rejected request to %s: %s", description, e)
+                _record_result(True)
+                return None
+            error = e
+        except requests.exceptions.ConnectionError as e:
+            if _is_connection_refused(e):
+                # Nothing is listening; the bot is down, not slow, so retrying only adds delay
+                logger.warning("Music bot refused the connection; not retrying request to %s.", description)
+                _record_result(False)
+                return None
+            error = e
+        except requests.exceptions.Timeout as e:
+            error = e
+        except requests.exceptions.RequestException as e:
+            # Anything else (bad URL, redirect loop, ...) won't be fixed by sending it again
+            logger.warning("Request to %s failed: %s", description, e)
+            _record_result(False)
+            return None
+        else:
+            _record_result(True)
+            # The request was delivered; parse outside the retry handling so an empty or
+            # non-JSON reply is never mistaken for a failure and sent again.
+            try:
+                return response.json()
+            except ValueError:
+                return None
+        logger.info("Attempt %d to %s failed: %s", attempt, description, error)
+        if attempt == max_retries:
+            logger.warning("Max retries reached. Request to %s failed: %s", description, error)
+            _record_result(False)
+            return None
+        # Truncated exponential backoff with jitter (0.1s, 0.2s, 0.4s, ... by default)
+        time.sleep(min(retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY) + random.uniform(0, 0.05))
+
+def send_play_command(song_name: str, max_retries: int = 3, retry_delay: float = 0.1, immediate: bool = False):
     """
     Send request to music bot to play a specific song, with retry logic.
 
     Args:
         song_name: Name/query of the song to play
         max_retries: Maximum number of retries on failure
-        retry_delay: Delay (in seconds) between retries
+        retry_delay: Base delay (in seconds) before the first retry
         immediate: Whether to include the "immediate" option in the API call
 
     Returns:
         dict: Response from the music bot API, or None on failure
     """
-    if not music_bot_base_url:
-        logging.warning("MUSIC_BOT_URL not configured; skipping play command")
+    if not CFG.music_bot_url:
+        logger.warning("MUSIC_BOT_URL not configured; skipping play command")
         return None
 
-    url = f"{music_bot_base_url}play"
     payload = {
-        "guildId": guild_id,                # Discord Server ID where the bot operates
-        "userId": user_id,                  # Discord User ID of the person issuing the command
-        "voiceChannelId": voice_channel_id,  # Discord Voice Channel ID to join/play in
+        **BASE_PAYLOAD,
         "options": {
             "query": song_name,
             "immediate": immediate           # Include the "immediate" option
         }
     }
+    return _post(CMD_URLS["play"], _encode_payload(payload), f"play '{song_name}'", max_retries, retry_delay)
 
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = session.post(url, json=payload)
-            response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
-            return response.json()
-        except (requests.exceptions.ConnectionError, requests.exceptions.RequestException) as e:
-            print(f"Attempt {attempt} to play '{song_name}' failed: {e}")
-            if attempt == max_retries:
-                print("Max retries reached. Play request failed.")
-                return None
-            time.sleep(retry_delay)  # Wait before retrying
-
-def send_command(command: str, max_retries: int = 3, retry_delay: float = 1.0):
+def send_command(command: str, max_retries: int = 3, retry_delay: float = 0.1):
     """
     Send a control command to the music bot, with retry logic.
 
     Args:
         command: Command name (e.g., 'pause', 'resume', 'stop')
         max_retries: Maximum number of retries on failure
-        retry_delay: Delay (in seconds) between retries
+        retry_delay: Base delay (in seconds) before the first retry
 
     Returns:
         dict: Response from the music bot API, or None on failure
     """
-    if not music_bot_base_url:
-        logging.warning("MUSIC_BOT_URL not configured; skipping command '%s'", command)
+    if not CFG.music_bot_url:
+        logger.warning("MUSIC_BOT_URL not configured; skipping command '%s'", command)
         return None
 
-    url = f"{music_bot_base_url}{command}"
-    payload = {
-        "guildId": guild_id,                # Discord Server ID
-        "userId": user_id,                  # Discord User ID
-        "voiceChannelId": voice_channel_id,  # Discord Voice Channel ID
-        "options": {}                       # General commands usually don't need specific options
-    }
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = session.post(url, json=payload)
-            response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
-            return response.json()
-        except (requests.exceptions.ConnectionError, requests.exceptions.RequestException) as e:
-            print(f"Attempt {attempt} to send command '{command}' failed: {e}")
-            if attempt == max_retries:
-                print("Max retries reached. Command request failed.")
-                return None
-            time.sleep(retry_delay)  # Wait before retrying
+    # General commands don't need specific options, so the cached body is reused
+    return _post(CMD_URLS[command], COMMAND_BODY, f"send command '{command}'", max_retries, retry_delay)
+
+# Background pool for music bot requests so the voice loop never waits on HTTP
+_http_pool = ThreadPoolExecutor(max_workers=MUSIC_BOT_WORKERS, thread_name_prefix="musicbot")
+
+def _log_if_err(fut):
+    """Done-callback that reports exceptions raised by a background music bot request."""
+    exc = fut.exception()
+    if exc is not None:
+        logger.error("Music bot request failed: %s", exc)
+
+def _dispatch_cmd(command: str):
+    """Queue send_command on the HTTP pool and return immediately."""
+    _http_pool.submit(send_command, command).add_done_callback(_log_if_err)
+
+def _dispatch_play(song_name: str, immediate: bool = False):
+    """Queue send_play_command on the HTTP pool and return immediately."""
+    _http_pool.submit(send_play_command, song_name, immediate=immediate).add_done_callback(_log_if_err)
 
-def handle_play_command(cleaned_transcript: str, keyword: str):
+def _ack_and_dispatch(tts: AsyncTTS, ack: str, api_path: str,
+                      song_name: str | None = None, immediate: bool = False):
     """
-    Handle play-related commands by extracting the song name and calling send_play_command.
+    Speak the acknowledgement and hand the music bot request to the HTTP pool.
+
+    Both steps are queued, so the caller can go straight back to listening
+    for the wake word without waiting on speech or network round-trips.
+    While the circuit breaker is open the user is told immediately instead.
+
+    Args:
+        tts: Speech engine used for the acknowledgement.
+        ack: Phrase to speak back to the user.
+        api_path: Music bot command name (ignored when song_name is given).
+        song_name: If set, a play request is sent for this query instead.
+        immediate: Whether the play request should jump the queue.
+    """
+    if not music_bot_available():
+        tts.speak_async("Music bot unavailable.")
+        return
+    # Submit the request first so the POST is already on the wire while SAPI
+    # starts synthesizing the acknowledgement on the TTS thread.
+    if song_name is None:
+        _dispatch_cmd(api_path)
+    else:
+        _dispatch_play(song_name, immediate=immediate)
+    tts.speak_async(ack)
+
+# --- Command grammar -------------------------------------------------------
+# Simple control commands: keyword -> (spoken acknowledgement, music bot API path)
+DISPATCH = {
+    "now playing": ("Now playing.", "now-playing"),
+    "stop": ("Stopping.", "stop"),
+    "pause": ("Pausing.", "pause"),
+    "resume": ("Resuming.", "resume"),
+    "next": ("Skipping.", "next"),
+    "skip": ("Skipping.", "next"),
+    "clear": ("Clearing.", "clear"),
+}
+PLAY_KEYWORDS = frozenset({"play", "played"})
+EXIT_KEYWORDS = frozenset({"kill self", "kill myself", "self destruct"})
+# "cancel" anywhere in the transcript overrides any other command, so it is searched
+# for separately rather than competing for first place in COMMAND_RE
+CANCEL_RE = re.compile(r"\bcancel\b", re.IGNORECASE)
+
+# Leading wake word captured in the pre-roll audio, e.g. "Jarvis, play ..."
+WAKE_PREFIX_RE = re.compile(r"^\s*jarvis\b[\s,]*", re.IGNORECASE)
+
+# Optional "immediate"/"immediately" modifier right after the play keyword
+IMMEDIATE_RE = re.compile(r"immediate(?:ly)?\b", re.IGNORECASE)
+
+def _compile_command_re(keywords) -> re.Pattern:
+    """
+    Build one alternation that finds the first command keyword in a single pass.
+
+    Longer keywords are tried first so "played" wins over "play", and spaces in
+    multi-word keywords match any run of whitespace.
+    """
+    alternatives = (re.escape(k).replace(r"\ ", r"\s+") for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(r"\b(" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+# Generated from the tables above so adding a command only touches one place.
+COMMAND_RE = _compile_command_re([*DISPATCH, *PLAY_KEYWORDS, *EXIT_KEYWORDS])
+
+def handle_play_command(cleaned_transcript: str, keyword_end: int) -> tuple[str, bool]:
+    """
+    Extract the song name and "immediate" flag from a play command.
 
     Args:
         cleaned_transcript: The cleaned user input.
-        keyword: The keyword to look for in the transcript (e.g., "play", "played").
+        keyword_end: Offset just past the matched play keyword (e.g., "play", "played").
+
+    Returns:
+        tuple[str, bool]: The song name (empty if none was given) and whether it
+                          should play immediately.
     """
-    idx = cleaned_transcript.lower().find(keyword)
-    remaining_text = cleaned_transcript[idx + len(keyword):].strip()  # Extract text after the keyword
-
-    # Check if "immediate" is in the remaining text
-    immediate = False
-    if remaining_text.lower().startswith("immediate"):
-        immediate = True
-        # Remove "immediate" from the remaining text
-        remaining_text = remaining_text[len("immediate"):].strip()
-    elif remaining_text.lower().startswith("immediately"):
-        immediate = True
-        # Remove "immediate" from the remaining text
-        remaining_text = remaining_text[len("immediately"):].strip()
-
-    song = remaining_text  # The remaining text is the song name
+    remaining_text = cleaned_transcript[keyword_end:].strip()  # Extract text after the keyword
+
+    # A leading "immediate"/"immediately" asks the bot to play right away; strip it
+    immediate_match = IMMEDIATE_RE.match(remaining_text)
+    if immediate_match is None:
+        return remaining_text, False
+    return remaining_text[immediate_match.end():].strip(), True
+
+# Live partials are only useful on an interactive terminal; when output is redirected
+# (service/log file) only the final transcript is written.
+SHOW_PARTIALS = sys.stdout.isatty()
+# ANSI "erase line" clears leftovers when a partial gets shorter, without padding
+_CLEAR_LINE = "\r\x1b[2K"
+
+# Minimum seconds between console redraws of the partial transcription (~10 Hz)
+PARTIAL_DISPLAY_INTERVAL = 0.1
+
+def _show_partial(text: str, shown: str = "") -> str:
+    """
+    Update the console line with the growing transcription.
+
+    Partials usually just extend the previous one, so only the new suffix is
+    written; when Vosk revises earlier words the whole line is redrawn.
+
+    Args:
+        text: Latest transcription.
+        shown: What is currently on the line.
+
+    Returns:
+        str: The text now on the line (pass back in as `shown` next time).
+    """
+    if shown and text.startswith(shown):
+        sys.stdout.write(text[len(shown):])
+    else:
+        sys.stdout.write(_CLEAR_LINE + text)
+    sys.stdout.flush()
+    return text
+
+def _on_wake(services: Services, pre_buffered_audio):
+    """
+    Interrupt speech, start transcription and acknowledge the wake word.
+
+    The transcription generator is created before "Yes?" is queued so that the
+    acknowledgement can never delay audio consumption; the generator starts
+    reading the stream on the caller's first next().
+
+    Args:
+        services: Resources created by init_services().
+        pre_buffered_audio: Audio captured just before the wake word.
+
+    Returns:
+        Iterator[str]: Partial transcriptions, ending with the final text.
+    """
+    services.tts.stop()   # interrupt any ongoing speech
+    # AudioHub is a consume-once queue: transcription picks up with the first chunk after
+    # the wake word frame, but the audio the wake word loop already read (including the
+    # wake word itself) is gone from the hub, so it is handed over as the pre-roll.
+    transcript_iter = record_and_transcribe(services.audio, initial_audio_buffer=pre_buffered_audio)
+    services.tts.speak_async("Yes?")  # Acknowledge wake word
+    return transcript_iter
+
+# --- Command handlers -------------------------------------------------------
+# Each handler takes (tts, cleaned_transcript, keyword, match) and returns False
+# when Jarvis should stop listening.
+
+def _handle_control(tts: AsyncTTS, cleaned_transcript: str, keyword: str, match: re.Match) -> bool:
+    """Acknowledge and send a simple playback control command."""
+    _ack_and_dispatch(tts, *DISPATCH[keyword])
+    return True
+
+def _handle_play(tts: AsyncTTS, cleaned_transcript: str, keyword: str, match: re.Match) -> bool:
+    """Play the song named after the matched keyword."""
+    song, immediate = handle_play_command(cleaned_transcript, match.end())
     if song:
-        tts.speak_async(f"Playing {song}")
-        send_play_command(song, immediate=immediate)
+        _ack_and_dispatch(tts, f"Playing {song}", "play", song_name=song, immediate=immediate)
+    return True
 
-def listen_for_voice_commands():
+def _handle_exit(tts: AsyncTTS, cleaned_transcript: str, keyword: str, match: re.Match) -> bool:
+    """Say goodbye and end the voice loop."""
+    tts.speak_async("Goodbye.")
+    return False
+
+COMMANDS = {
+    **dict.fromkeys(DISPATCH, _handle_control),
+    **dict.fromkeys(PLAY_KEYWORDS, _handle_play),
+    **dict.fromkeys(EXIT_KEYWORDS, _handle_exit),
+}
+
+# Set (e.g. by Ctrl-C) to ask the listener thread to stop after its current step
+shutdown_event = threading.Event()
+
+def listen_for_voice_commands(services: Services):
     """
     Main voice command loop.
     Continuously listens for wake word, transcribes subsequent speech,
     interprets commands, and executes appropriate actions. Supports
     music playback control and self-termination commands.
+
+    Args:
+        services: Resources created by init_services().
     """
-    while True:
-        print('Say "Jarvis" to wake...')
+    tts = services.tts
+    audio = services.audio
+    while not shutdown_event.is_set():
+        logger.info('Say "Jarvis" to wake...')
         # wait_for_wake_word now returns the pre-buffered audio
-        pre_buffered_audio = wait_for_wake_word(shared_stream)
+        pre_buffered_audio = wait_for_wake_word(audio)
+        if shutdown_event.is_set():
+            break  # Audio was closed under us; don't start a transcription
         # If pre_buffered_audio is empty, it might mean Porcupine isn't initialized
         # or an error occurred. We can choose to continue or handle it.
         # For now, we'll proceed, and transcribe.py will handle an empty buffer.
         if not pre_buffered_audio:
-            print("Warning: No pre-buffered audio received. Proceeding without it.")
+            logger.warning("No pre-buffered audio received. Proceeding without it.")
             # Optionally, you could 'continue' here to re-listen if this is critical
 
-        tts.stop()   # interrupt any ongoing speech
-        print("Wake word detected.")
-        tts.speak_async("Yes?")  # Acknowledge wake word
+        logger.info("Wake word detected.")
         transcript = ""
-        # Pass the pre_buffered_audio to record_and_transcribe
-        for partial in record_and_transcribe(shared_stream, initial_audio_buffer=pre_buffered_audio):
-            # overwrite the current line with the growing sentence
-            print('\r' + partial + ' ' * 20, end='', flush=True)
+        shown = ""                        # text currently on the console line
+        last_shown = 0.0
+        for partial in _on_wake(services, pre_buffered_audio):
             transcript = partial          # will end up holding the final yield
-        print()                           # newline after the overwrite loop
-        # Remove "Jarvis" if it's at the beginning of the transcript, case-insensitively,
-        # and handle potential following comma/space.
-        cleaned_transcript = transcript
-        words = transcript.split(None, 1) # Split into first word and the rest
-        if words and words[0].lower().rstrip(',') == "jarvis":
-            cleaned_transcript = words[1] if len(words) > 1 else ""
-
-        cleaned_transcript = cleaned_transcript.strip() # Final strip for good measure
-
-        # Check for 'cancel' command first
-        if "cancel" in cleaned_transcript.lower():
-            print("User said 'cancel'. Aborting current command.")
+            now = time.monotonic()
+            if SHOW_PARTIALS and now - last_shown >= PARTIAL_DISPLAY_INTERVAL:
+                # extend (or redraw) the current line with the growing sentence
+                shown = _show_partial(partial, shown)
+                last_shown = now
+        if SHOW_PARTIALS:
+            _show_partial(transcript, shown)  # always show the final text, even if throttled
+            print()                       # newline after the overwrite loop
+        else:
+            logger.info("Heard: %s", transcript)
+        if shutdown_event.is_set():
+            break  # Shutting down mid-command; the transcript was cut short, don't act on it
+        # Remove "Jarvis" if it's at the beginning of the transcript (the pre-roll audio
+        # usually contains the wake word itself), along with any following comma/space.
+        cleaned_transcript = WAKE_PREFIX_RE.sub("", transcript, count=1).strip()
+
+        # Command interpretation and execution
+        if CANCEL_RE.search(cleaned_transcript):
+            logger.info("User said 'cancel'. Aborting current command.")
             tts.speak_async("Cancelled.")
             continue # Skip the rest of command processing and listen for wake word again
 
-        print(f"You said: {cleaned_transcript}")
+        logger.info("You said: %s", cleaned_transcript)
 
-        # Command interpretation and execution
-        # Use a lowercased version of the cleaned_transcript for command matching.
-        command_text_for_matching = cleaned_transcript.lower()
-
-        if ("now" in command_text_for_matching and "playing" in command_text_for_matching):
-            tts.speak_async("Now playing.")
-            send_command("now-playing")
-        elif "played" in command_text_for_matching:
-            handle_play_command(cleaned_transcript, keyword="played")
-        elif "play" in command_text_for_matching:
-            handle_play_command(cleaned_transcript, keyword="play")
-        # Basic playback controls
-        elif "stop" in command_text_for_matching:
-            tts.speak_async("Stopping.")
-            send_command("stop")
-        elif "pause" in command_text_for_matching:
-            tts.speak_async("Pausing.")
-            send_command("pause")
-        elif "resume" in command_text_for_matching:
-            tts.speak_async("Resuming.")
-            send_command("resume")
-        elif ("next" in command_text_for_matching) or ("skip" in command_text_for_matching):
-            tts.speak_async("Skipping.")
-            send_command("next")
-        elif "clear" in command_text_for_matching:
-            tts.speak_async("Clearing.")
-            send_command("clear")
-        # Exit commands
-        elif ("kill" in command_text_for_matching and "self" in command_text_for_matching) or \
-             ("self" in command_text_for_matching and "destruct" in command_text_for_matching):
-            tts.speak_async("Goodbye.")
-            break
-        else:
-            if cleaned_transcript: # Only say "Huh?" if there was actual text after cleaning
-                tts.speak_async("Huh?")
+        # COMMAND_RE is case-insensitive, so only the matched keyword is lowercased;
+        # match offsets then index straight into cleaned_transcript.
+        match = COMMAND_RE.search(cleaned_transcript)
+        keyword = " ".join(match.group(1).lower().split()) if match else None
+
+        handler = COMMANDS.get(keyword)
+        if handler is not None:
+            if not handler(tts, cleaned_transcript, keyword, match):
+                break # Exit command
+        elif cleaned_transcript: # Only say "Huh?" if there was actual text after cleaning
+            tts.speak_async("Huh?")
+
+# Seconds main() waits at shutdown for the listener thread to notice and exit
+LISTENER_JOIN_TIMEOUT = 1.0
 
 def main():
     """
@@ -316,20 +719,36 @@ def main():
 
     Ensures proper cleanup of audio resources on exit.
     """
+    logging.basicConfig(level=logging.INFO if VERBOSE else logging.WARNING, format="%(message)s")
+    services = None
+    listener = None
     try:
         print("Starting Jarvis...")
-        # Start the main loop to listen for wake word and commands
-        listen_for_voice_commands()
+        services = init_services()
+        # Installed only once startup is done, so Ctrl-C still aborts the (slow) model
+        # load immediately. From here on it only flags shutdown; the main thread notices
+        # within a fraction of a second even while the listener is blocked waiting for audio.
+        signal.signal(signal.SIGINT, lambda *_: shutdown_event.set())
+        # Run the wake word / command loop on its own thread so the main thread stays
+        # free to react to signals and start cleanup promptly.
+        listener = threading.Thread(target=listen_for_voice_commands, args=(services,),
+                                    name="listener", daemon=True)
+        listener.start()
+        while listener.is_alive() and not shutdown_event.is_set():
+            listener.join(timeout=0.2)
     finally:
+        shutdown_event.set()
         # This block ensures that resources are cleaned up regardless of how the try block exits
         print("\nShutting down Jarvis and cleaning up resources...")
-        if 'shared_stream' in locals() and shared_stream.is_active():
-            shared_stream.stop_stream()  # Stop the stream before closing
-            shared_stream.close()        # Release the audio stream resource
-        if '_pa' in locals():
-            _pa.terminate()              # Terminate the PyAudio session
-        if 'tts' in locals():
-            tts.shutdown()               # Gracefully shut down the TTS worker thread
+        if listener is not None and listener.is_alive():
+            # Wake the listener if it is waiting for audio and give it a moment to see
+            # shutdown_event, so it doesn't dispatch into a closed pool or closed services.
+            services.audio.close()
+            listener.join(timeout=LISTENER_JOIN_TIMEOUT)
+        # Don't block exit on in-flight music bot requests, and drop ones not yet started
+        _http_pool.shutdown(wait=False, cancel_futures=True)
+        if services is not None:
+            services.close()
         print("Cleanup complete. Goodbye!")
 
 # Standard Python entry point: ensures main() is called only when the script is executed directly.
@@ -3,12 +3,12 @@ Real-time speech transcription module using Vosk.
 
 This module provides continuous speech-to-text functionality with silence detection
 for automatic termination. It uses the Vosk offline speech recognition engine
-with a pre-loaded model for efficient, low-latency transcription.
+with a model loaded once by `initialize_vosk_model()` for efficient, low-latency
+transcription.
 """
 
 import json
-import time
-import threading
+import os
 
 import numpy as np
 from vosk import Model, KaldiRecognizer # Moved Vosk import to the top
@@ -20,35 +20,78 @@ CHUNK = 512          # Frames per buffer: number of audio frames processed at a
 
 # Silence detection configuration
 RMS_THRESHOLD = 900               # RMS amplitude: threshold below which audio is considered silent.
-SILENCE_CHUNKS_END = int(1.5 * RATE / CHUNK)   # Silent chunks to stop: number of consecutive silent chunks before transcription stops (approx. 1.2 seconds).
+RMS_SS_THRESHOLD = RMS_THRESHOLD * RMS_THRESHOLD * CHUNK  # Same threshold as a per-chunk sum of squared samples.
+SILENCE_CHUNKS_END = int(1.5 * RATE / CHUNK)   # End-of-speech window: number of most recent chunks examined for silence (approx. 1.5 seconds).
+SPEECH_CHUNKS_END = int(0.1 * SILENCE_CHUNKS_END)  # Transcription stops once the window holds at most this many speech chunks,
+                                                   # so brief noises (a click, a breath) don't keep recording alive.
 MAX_CHUNKS = int(6 * RATE / CHUNK)             # Max recording chunks: maximum number of chunks to record before stopping (approx. 6 seconds).
 
-# --- Vosk Model Loading with Spinner ---
-_model_load_event = threading.Event() # Event to signal spinner thread to stop
-
-def _spinner_worker(event, msg="Loading Vosk model..."):
-    """Displays a simple CLI spinner until the event is set."""
-    spinner_chars = "|/-\\"
-    idx = 0
-    while not event.is_set():
-        print(f"\r{msg} {spinner_chars[idx % len(spinner_chars)]}", end="", flush=True)
-        idx += 1
-        time.sleep(0.1)
-    print("\r" + " " * (len(msg) + 2) + "\r", end="", flush=True) # Clear spinner line
-
-print("Initializing Vosk model (this may take a moment)...")
-_spinner_thread = threading.Thread(target=_spinner_worker, args=(_model_load_event,))
-_spinner_thread.start()
-
-# Initialize Vosk components (done once at module load for performance)
-model = Model("model")  # Loads the speech recognition model from the 'model' directory.
-                        # This can be memory-intensive and take time on first load.
-rec = KaldiRecognizer(model, RATE)  # Creates a recognizer instance, configured for the model and sample rate.
-                                    # This object will be used for all subsequent transcriptions.
-
-_model_load_event.set() # Signal spinner to stop
-_spinner_thread.join()  # Wait for spinner thread to finish
-print("Vosk model loaded successfully.")
+# Partial results: chunks between PartialResult() polls (4 chunks is about 128 ms).
+PARTIAL_POLL_CHUNKS = 4
+
+def set_rms_threshold(new_threshold):
+    """
+    Change the silence threshold used by record_and_transcribe().
+
+    Keeps RMS_SS_THRESHOLD in step so the recording loop never has to square the
+    threshold itself. Takes effect from the next recording.
+
+    Args:
+        new_threshold: RMS amplitude below which a chunk is considered silent.
+    """
+    global RMS_THRESHOLD, RMS_SS_THRESHOLD
+    RMS_THRESHOLD = new_threshold
+    RMS_SS_THRESHOLD = new_threshold * new_threshold * CHUNK
+
+# --- Vosk Model Loading ---
+MODEL_PATH = "model"  # Directory containing the Vosk model files.
+
+def _prefetch_model_files(path):
+    """
+    Ask the OS to start reading the model files into the page cache.
+
+    POSIX_FADV_WILLNEED returns immediately and lets the kernel read all files
+    in the background, so a cold-cache Model() load spends less time waiting
+    on disk. A no-op on platforms without posix_fadvise (e.g., Windows).
+
+    Args:
+        path: Model directory to walk.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass  # Advisory only; the model load will read the file regardless
+            finally:
+                os.close(fd)
+
+# Vosk components, created once by initialize_vosk_model()
+model = None  # Speech recognition model loaded from MODEL_PATH (memory-intensive, slow on first load).
+rec = None    # Recognizer configured for the model and sample rate, reused for every transcription.
+
+def initialize_vosk_model():
+    """
+    Load the Vosk model and create the shared recognizer.
+
+    Idempotent: only the first call loads anything, so callers can invoke it at
+    startup and record_and_transcribe() can call it defensively.
+    """
+    global model, rec
+    if rec is not None:
+        return
+
+    print("Loading Vosk model (this may take a moment)...", flush=True)
+    _prefetch_model_files(MODEL_PATH)
+    model = Model(MODEL_PATH)
+    rec = KaldiRecognizer(model, RATE)
+    print("Vosk model loaded successfully.")
 
 def record_and_transcribe(stream, initial_audio_buffer=None):
     """
@@ -56,73 +99,88 @@ def record_and_transcribe(stream, initial_audio_buffer=None):
     Can be primed with an initial audio buffer.
 
     Args:
-        stream: Active PyAudio input stream object, configured with RATE and CHUNK settings
-                matching those used by the Vosk KaldiRecognizer.
-        initial_audio_buffer (list[bytes], optional): A list of raw audio byte chunks
-                                                      (each typically `CHUNK` size) to be processed
-                                                      before reading from the live stream.
-                                                      Useful for prepending audio, like from a wake word buffer.
-                                                      Defaults to None.
+        stream: Active PyAudio input stream or AudioHub, configured with RATE
+                and CHUNK settings matching those used by the Vosk KaldiRecognizer.
+        initial_audio_buffer (bytes, optional): Raw 16-bit PCM audio to be processed
+                                                before reading from the live stream.
+                                                Useful for prepending audio, like from a wake word buffer.
+                                                Defaults to None.
     Yields:
         str: Partial transcriptions.
     Returns:
         str: Final transcribed text, or empty string if no speech was detected.
     """
+    initialize_vosk_model()  # No-op once the model is loaded
     rec.Reset()  # Reset the recognizer's state to ensure a fresh transcription.
 
     # Prime the recognizer with the initial audio buffer if one is provided.
     # This is useful for including audio captured just before a command starts (e.g., rolling wake word buffer).
     if initial_audio_buffer:
-        print(f"Processing {len(initial_audio_buffer)} pre-buffered audio chunks...")
-        for chunk_data in initial_audio_buffer:
-            if isinstance(chunk_data, bytes):
-                rec.AcceptWaveform(chunk_data)  # Feed each chunk from the buffer to Vosk.
-            else:
-                # This case should ideally not be reached if wake_word.py correctly returns a list of bytes.
-                print(f"Warning: Initial audio buffer contained non-bytes data: {type(chunk_data)}. Skipping this chunk.")
-
-    silent_chunks_count = 0  # Counter for consecutive chunks of audio below the RMS silence threshold.
+        print(f"Processing {len(initial_audio_buffer) / (2 * RATE):.2f}s of pre-buffered audio...")
+        rec.AcceptWaveform(initial_audio_buffer)  # Feed the whole buffer to Vosk in one call.
+
+    speech_window = bytearray(SILENCE_CHUNKS_END)  # Ring of 0/1 flags: whether each recent chunk was above the threshold.
+    window_index = 0          # Next slot in speech_window to overwrite.
+    speech_in_window = 0      # Running count of speech chunks currently in speech_window.
+    speech_started = False    # Set on the first speech chunk; silence only ends a recording after it.
     total_chunks_count = 0   # Counter for the total number of chunks processed from the live stream.
     last_yielded_partial = "" # Stores the last partial result yielded to avoid redundant yields of the same text.
+    last_partial_json = ""    # Raw JSON of the last partial result, to skip re-parsing unchanged results.
+
+    # Bind globals and bound methods used every chunk to locals (LOAD_FAST instead of
+    # global/attribute lookups). Threshold changes take effect on the next recording.
+    read = stream.read
+    accept_waveform = rec.AcceptWaveform
+    partial_result = rec.PartialResult
+    frombuffer = np.frombuffer
+    ss_threshold = RMS_SS_THRESHOLD
+    window_chunks = SILENCE_CHUNKS_END
+    speech_chunks_end = SPEECH_CHUNKS_END
+    max_chunks = MAX_CHUNKS
+    poll_chunks = PARTIAL_POLL_CHUNKS
 
     while True:
-        # Read an audio chunk from the live stream.
-        # exception_on_overflow=False prevents PyAudio from raising an error if its internal buffer overflows,
-        # which can happen if Python's processing loop doesn't keep up with the audio input rate.
-        # Instead, older, unread data is silently discarded by PyAudio.
-        data = stream.read(CHUNK, exception_on_overflow=False)
-        rec.AcceptWaveform(data)    # Feed the live audio data to the Vosk recognizer.
+        # Read the next audio chunk. AudioHub queues audio captured while this loop is busy
+        # (dropping only the oldest beyond its backlog); exception_on_overflow=False keeps a
+        # plain PyAudio stream from raising if its internal buffer overflows.
+        data = read(CHUNK, exception_on_overflow=False)
+        accept_waveform(data)    # Feed the live audio data to the Vosk recognizer.
         total_chunks_count += 1
 
         # ----- Partial result streaming -----
-        # Check for and yield partial transcription results for live feedback.
-        partial_result_json = rec.PartialResult() # Get current partial result from Vosk (as JSON string).
-        partial_text = json.loads(partial_result_json).get("partial", "").strip()
-
-        if partial_text and partial_text != last_yielded_partial:
-            yield partial_text  # Stream out new words as they are recognized.
-            last_yielded_partial = partial_text
-
-        # Convert audio data to numpy array for RMS calculation
-        audio_i16 = np.frombuffer(data, dtype=np.int16)
-        if audio_i16.size:
-            # Calculate Root Mean Square (RMS) amplitude of the audio chunk to detect silence.
-            # Convert to float32 to prevent overflow during squaring and for precision in mean calculation.
-            rms = np.sqrt(np.mean(audio_i16.astype(np.float32)**2))
-        else:
-            rms = 0.0  # Consider empty chunks (e.g., if stream.read returned no data) as silent.
-
-        # Silence detection logic:
-        if rms < RMS_THRESHOLD:  # If the chunk's RMS is below the silence threshold.
-            silent_chunks_count += 1
-            if silent_chunks_count >= SILENCE_CHUNKS_END: # If enough consecutive silent chunks are detected.
-                print("\nSilence detected, stopping transcription.")
-                break  # Stop recording and transcribing.
-        else:
-            silent_chunks_count = 0  # Reset silence counter if sound is detected (RMS >= threshold).
+        # Check for and yield partial transcription results for live feedback. Vosk decodes
+        # new words far less often than once per chunk, so only poll every few chunks.
+        if total_chunks_count % poll_chunks == 0:
+            partial_result_json = partial_result() # Get current partial result from Vosk (as JSON string).
+            # Vosk repeats the same partial until a new word is decoded, so only parse it when it changes.
+            if partial_result_json != last_partial_json:
+                last_partial_json = partial_result_json
+                partial_text = json.loads(partial_result_json).get("partial", "").strip()
+
+                if partial_text and partial_text != last_yielded_partial:
+                    yield partial_text  # Stream out new words as they are recognized.
+                    last_yielded_partial = partial_text
+
+        # Silence detection: compare the chunk's sum of squared samples against the
+        # precomputed squared threshold, which is equivalent to RMS < RMS_THRESHOLD
+        # without the mean and square root. Upcast to int64 so squaring can't overflow.
+        samples = frombuffer(data, dtype=np.int16).astype(np.int64)
+        sum_squares = int(samples @ samples)  # Empty chunks (e.g., stream closed) count as silent
+        is_speech = int(sum_squares >= ss_threshold)  # Boolean arithmetic, no branch on the flag
+        # Slide the window: add this chunk's flag and drop the one it overwrites (O(1) per chunk).
+        speech_started = speech_started or bool(is_speech)
+        speech_in_window += is_speech - speech_window[window_index]
+        speech_window[window_index] = is_speech
+        window_index = (window_index + 1) % window_chunks
+        # Once speech has started and a full window has been recorded, stop if the window
+        # is (almost) entirely silent. A pause before speaking (e.g., after "Yes?") doesn't
+        # end the recording; max_chunks still bounds the wait.
+        if speech_started and total_chunks_count >= window_chunks and speech_in_window <= speech_chunks_end:
+            print("\nSilence detected, stopping transcription.")
+            break  # Stop recording and transcribing.
 
         # Safety timeout: Stop recording if it exceeds the maximum configured duration.
-        if total_chunks_count >= MAX_CHUNKS:
+        if total_chunks_count >= max_chunks:
             print("\nMaximum recording duration reached, stopping transcription.")
             break
 
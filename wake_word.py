@@ -2,62 +2,117 @@
 import pvporcupine
 import numpy as np
 import os
-import collections
+import functools
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize Porcupine
-porcupine = None
-try:
-    porcupine = pvporcupine.create(
-        access_key=os.getenv("PORCUPINE_KEY"),
-        keywords=["jarvis"]
-    )
-except pvporcupine.PorcupineError as e:
-    print(f"Failed to initialize Porcupine: {e}")
-    # Handle error appropriately, e.g., raise an exception or exit
+logger = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=1)
+def _get_porcupine():
+    """
+    Create the Porcupine detector on first use and reuse it afterwards.
+
+    Deferred from import so that merely importing this module doesn't load the
+    wake word model. A failed initialization is cached too (as None), so the
+    error is reported once instead of on every listen.
+    """
+    try:
+        return pvporcupine.create(
+            access_key=os.getenv("PORCUPINE_KEY"),
+            keywords=["jarvis"]
+        )
+    except pvporcupine.PorcupineError as e:
+        logger.error("Failed to initialize Porcupine: %s", e)
+        return None
 
 # Configuration for the rolling buffer
-BUFFER_SECONDS = 1.0  # Duration of audio to buffer before wake word
+# Duration of audio to buffer before the wake word. Transcription only needs a
+# little leading context, so the default is short; override with JARVIS_WAKE_PREROLL_S.
+BUFFER_SECONDS = float(os.getenv("JARVIS_WAKE_PREROLL_S", "0.3"))
 
-# These will be defined properly if porcupine initializes
-NUM_BUFFER_CHUNKS = 0
-if porcupine:
-    # Porcupine sample rate is fixed at 16000 Hz
-    RATE = porcupine.sample_rate
-    # Number of audio chunks to buffer
-    NUM_BUFFER_CHUNKS = int(BUFFER_SECONDS * RATE / porcupine.frame_length)
+# Energy gate: Porcupine only runs on frames whose RMS reaches this level, plus a
+# short hangover afterwards, so long silences skip the neural network entirely.
+# Kept well below speech level so quiet onsets still reach the detector.
+WAKE_GATE_RMS = 100
+WAKE_GATE_HANGOVER_FRAMES = 16  # Frames (~0.5 s) kept running after the last loud one
 
 def wait_for_wake_word(stream):
     """
-    Block until the wake word is detected on the shared PyAudio stream.
-    Returns a buffer of audio data (list of byte chunks) leading up to the wake word.
-    Returns an empty list if Porcupine is not initialized or an error occurs.
+    Block until the wake word is detected on the shared audio source
+    (a PyAudio stream or an AudioHub).
+    Returns the audio leading up to the wake word as one contiguous bytes object
+    of 16-bit PCM, oldest sample first.
+    Returns empty bytes if Porcupine is not initialized or an error occurs.
     """
+    porcupine = _get_porcupine()
     if not porcupine:
-        print("Error: Porcupine not initialized. Cannot listen for wake word.")
-        return []
+        logger.error("Porcupine not initialized. Cannot listen for wake word.")
+        return b""
+
+    # Number of audio chunks to buffer (Porcupine's sample rate is fixed at 16000 Hz),
+    # rounded up to a power of two so the ring index wraps with a mask instead of a
+    # modulo. This can buffer somewhat more than BUFFER_SECONDS (e.g., 16 frames for 0.3 s).
+    num_buffer_chunks = max(1, int(BUFFER_SECONDS * porcupine.sample_rate / porcupine.frame_length))
+    num_buffer_chunks = 1 << (num_buffer_chunks - 1).bit_length()
+    head_mask = num_buffer_chunks - 1
+
+    # Preallocated ring of the most recent frames; each frame is decoded into its
+    # row in place, so the loop creates no per-frame buffers of its own.
+    ring = np.empty((num_buffer_chunks, porcupine.frame_length), dtype=np.int16)
+    # Views over each row, created once: int16 arrays for the energy gate, typed
+    # int16 memoryviews for Porcupine (which unpacks its input sample by sample, and
+    # memoryviews yield plain ints far faster than numpy scalars), and byte views the
+    # raw PCM is copied into. No objects are built per frame.
+    rows = list(ring)
+    row_samples = [memoryview(row) for row in rows]  # format "h"
+    row_bytes = [samples.cast("B") for samples in row_samples]
+    head = 0    # Row the next frame is written to
+    filled = 0  # Rows holding audio so far (the ring starts empty)
+    gate_sum_squares = WAKE_GATE_RMS * WAKE_GATE_RMS * porcupine.frame_length
+    hangover = 0  # Frames left to process after the last loud one
+
+    # Locals for everything the per-frame loop touches (avoids repeated attribute
+    # and global lookups ~31 times a second)
+    frame_length = porcupine.frame_length
+    process = porcupine.process
+    read = stream.read
+    hangover_frames = WAKE_GATE_HANGOVER_FRAMES
+    int64 = np.int64
 
-    audio_buffer = collections.deque(maxlen=NUM_BUFFER_CHUNKS)
-    
     try:
-        print(f"Listening for wake word (buffering ~{BUFFER_SECONDS:.1f}s of audio)...")
+        logger.info("Listening for wake word (buffering ~%.2fs of audio)...",
+                    num_buffer_chunks * frame_length / porcupine.sample_rate)
         while True:
             # Read audio data in chunks matching Porcupine's frame length
-            pcm_bytes = stream.read(porcupine.frame_length,
-                                    exception_on_overflow=False)
-            
-            # Add the raw audio bytes to our buffer
-            audio_buffer.append(pcm_bytes)
-            
-            # Process the audio chunk with Porcupine
-            # Convert bytes to int16 PCM samples
-            pcm = np.frombuffer(pcm_bytes, dtype=np.int16)
-            
-            if porcupine.process(pcm) >= 0:
-                print("Wake word detected!")
-                return list(audio_buffer)  # Return the buffered audio chunks
-    except Exception as e:
-        print(f"Wake-word listening error: {e}")
-        return [] # Return empty list on error
+            pcm_bytes = read(frame_length, exception_on_overflow=False)
+            if not pcm_bytes:
+                return b""  # Audio source closed (shutting down)
+
+            # Copy the int16 PCM samples straight into the ring
+            row_bytes[head][:] = pcm_bytes
+            pcm = rows[head]
+            pcm_samples = row_samples[head]
+            head = (head + 1) & head_mask
+            filled = min(filled + 1, num_buffer_chunks)
+
+            # Skip Porcupine on silent frames once the hangover has run out
+            samples = pcm.astype(int64)
+            if int(samples @ samples) >= gate_sum_squares:
+                hangover = hangover_frames
+            elif hangover:
+                hangover -= 1
+            else:
+                continue
+
+            if process(pcm_samples) >= 0:
+                logger.info("Wake word detected!")
+                # Unroll the ring oldest-first into a single bytes object
+                if filled < num_buffer_chunks:
+                    return ring[:filled].tobytes()
+                return np.concatenate((ring[head:], ring[:head])).tobytes()
+    except (OSError, pvporcupine.PorcupineError) as e:
+        logger.error("Wake-word listening error: %s", e)
+        return b"" # Return empty bytes on error